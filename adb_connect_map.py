@@ -1,230 +1,754 @@
+import argparse
+import asyncio
+import functools
 import json
 import os
 import re
 import subprocess
-import sys
-from typing import Dict, List, Optional
+import time
+from typing import Any, AsyncGenerator, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
 
+try:
+    import orjson
+    _HAS_ORJSON = True
+except ImportError:
+    _HAS_ORJSON = False
 
-def adb_command(command: str) -> Optional[str]:
+# File the device map is stored in
+DEVICE_MAP_FILE = "device_map.json"
+
+# Device properties read via getprop, keyed by their device_map.json field
+DEVICE_PROPERTIES = {
+    "model": "ro.product.model",
+    "device_type": "ro.product.device",
+    "serial_number": "ro.serialno",
+}
+
+# Marker echoed between the outputs of batched shell commands
+SECTION_DELIMITER = "---"
+
+# Upper bound on the number of devices queried concurrently
+MAX_CONCURRENT_QUERIES = 32
+
+# Seconds before cached device properties (model, device type) are re-read
+STATIC_TTL = 24 * 60 * 60
+
+# Seconds before a cached Wi-Fi IP address is re-read
+DYNAMIC_TTL = 30
+
+# Seconds a cached `adb devices -l` result is reused by get_adb_devices
+ADB_DEVICES_TTL = 5.0
+
+# Marker echoed before each command sent to an AdbShell; anything the shell prints
+# ahead of it (a prompt, or the command line echoed back by a PTY) is discarded
+SHELL_BEGIN_MARKER = "__BEGIN__"
+
+# Marker echoed (followed by the exit code) after each command sent to an AdbShell
+SHELL_SENTINEL = "__END__"
+
+# Match the marker lines; only digits may follow the end marker
+_SHELL_BEGIN_RE = re.compile(rf'{re.escape(SHELL_BEGIN_MARKER)}$')
+_SHELL_END_RE = re.compile(rf'^(.*){re.escape(SHELL_SENTINEL)}(\d+)$')
+
+# Matches the IPv4 address in `ip -o -4 addr show` output
+_INET_RE = re.compile(r'\binet (\d{1,3}(?:\.\d{1,3}){3})/')
+
+# Matches serials of devices connected over TCP/IP (e.g. 192.168.1.5:5555)
+_IP_SERIAL_RE = re.compile(r'^\d{1,3}(\.\d{1,3}){3}:\d+$')
+
+
+_R = TypeVar("_R")
+
+class _TTLCachedFunction(Generic[_R]):
+    """
+    A function wrapped by _ttl_cache. Results are cached, keyed on the call
+    arguments, for `ttl` seconds; cache_clear() drops them early.
+    """
+
+    def __init__(self, func: Callable[..., _R], ttl: float) -> None:
+        """
+        Wraps a function.
+        
+        Args:
+            func (Callable[..., _R]): The function whose results are cached.
+            ttl (float): How long, in seconds, a cached result stays valid.
+        """
+        functools.update_wrapper(self, func)
+        self._func = func
+        self._ttl = ttl
+        self._cache: Dict[Tuple[Any, ...], Tuple[float, _R]] = {}
+
+    def __call__(self, *args: Any) -> _R:
+        now = time.monotonic()
+        cached = self._cache.get(args)
+        if cached and cached[0] > now:
+            return cached[1]
+        value = self._func(*args)
+        self._cache[args] = (now + self._ttl, value)
+        return value
+
+    def cache_set(self, value: _R, *args: Any) -> None:
+        """
+        Stores a result obtained elsewhere as if the function had returned it.
+        
+        Args:
+            value (_R): The result to cache.
+            *args (Any): The call arguments the result is cached under.
+        """
+        self._cache[args] = (time.monotonic() + self._ttl, value)
+
+    def cache_clear(self) -> None:
+        """
+        Drops every cached result.
+        """
+        self._cache.clear()
+
+def _ttl_cache(ttl: float) -> Callable[[Callable[..., _R]], _TTLCachedFunction[_R]]:
+    """
+    Decorator that caches a function's results, keyed on its arguments, for `ttl` seconds.
+    
+    Args:
+        ttl (float): How long, in seconds, a cached result stays valid.
+    
+    Returns:
+        Callable[[Callable[..., _R]], _TTLCachedFunction[_R]]: The decorator.
+    """
+    def decorator(func: Callable[..., _R]) -> _TTLCachedFunction[_R]:
+        return _TTLCachedFunction(func, ttl)
+    return decorator
+
+def _load_json(data: bytes) -> Any:
+    """
+    Parses JSON, using orjson when it is installed and the standard library otherwise.
+    
+    Args:
+        data (bytes): The UTF-8 encoded JSON document.
+    
+    Returns:
+        Any: The parsed document.
+    """
+    if _HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _dump_json(obj: Any) -> bytes:
+    """
+    Serializes the device map in the 4-space indented format of device_map.json.
+    The standard library is used even when orjson is installed, because orjson
+    can only indent by 2 spaces and the file is meant to be edited by hand.
+    
+    Args:
+        obj (Any): The document to serialize.
+    
+    Returns:
+        bytes: The UTF-8 encoded JSON document.
+    """
+    return json.dumps(obj, indent=4).encode('utf-8')
+
+def adb_command(command: List[str]) -> Optional[str]:
     """
     Executes an ADB command and returns the output as a string.
     
     Args:
-        command (str): The ADB command to execute.
+        command (List[str]): The ADB command to execute, as an argument list.
     
     Returns:
         Optional[str]: The output of the command as a string, or None if the command fails.
     """
-    if not isinstance(command, str):
-        raise ValueError(f"Expected a string for command, got {type(command)}")
+    if not isinstance(command, list):
+        raise ValueError(f"Expected a list for command, got {type(command)}")
     
     try:
-        result = subprocess.check_output(command, stderr=subprocess.STDOUT, shell=True)
+        result = subprocess.check_output(command, stderr=subprocess.STDOUT)
         return result.decode('utf-8').strip()
-    except subprocess.CalledProcessError as e:
+    except (subprocess.CalledProcessError, OSError) as e:
         print(f"Error executing command: {e}")
         return None
 
-def get_device_connection_type(serial: str) -> str:
+async def adb_command_lines_async(command: List[str]) -> AsyncGenerator[str, None]:
     """
-    Returns whether a device is connected via USB or Wi-Fi based on the adb devices -l output.
+    Executes an ADB command without blocking the event loop and yields its output
+    line by line as it arrives, so callers can act on each line straight away.
+    Lines are yielded before the exit status is known, so callers must discard
+    what they parsed if an error is raised. The process is killed if the caller
+    stops iterating early.
+    
+    Args:
+        command (List[str]): The ADB command to execute, as an argument list.
+    
+    Yields:
+        str: Each non-empty stdout line, stripped of surrounding whitespace.
+    
+    Raises:
+        OSError: If the command cannot be started.
+        subprocess.CalledProcessError: If the command exits with a non-zero status.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    assert process.stdout is not None and process.stderr is not None
+    # Read stderr alongside stdout so error output cannot be mistaken for data
+    # and a full stderr pipe cannot stall the process
+    stderr_task = asyncio.ensure_future(process.stderr.read())
+    try:
+        async for raw_line in process.stdout:
+            line = raw_line.decode('utf-8').strip()
+            if line:
+                yield line
+
+        returncode = await process.wait()
+        stderr = await stderr_task
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, command, stderr=stderr)
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        stderr_task.cancel()
+        await asyncio.gather(stderr_task, return_exceptions=True)
+
+class AdbShell:
+    """
+    A long-lived `adb -s <serial> shell` process. Commands are written to its stdin,
+    so running one does not pay for a new adb process and device transport.
+    """
+
+    def __init__(self, serial: str, process: asyncio.subprocess.Process) -> None:
+        """
+        Wraps a running shell process; use AdbShell.start to create one.
+        
+        Args:
+            serial (str): The serial number of the device.
+            process (asyncio.subprocess.Process): The `adb shell` process.
+        """
+        assert process.stdin is not None and process.stdout is not None
+        self.serial = serial
+        self.process = process
+        self.stdin: asyncio.StreamWriter = process.stdin
+        self.stdout: asyncio.StreamReader = process.stdout
+
+    @classmethod
+    async def start(cls, serial: str) -> "AdbShell":
+        """
+        Starts the shell process for a device.
+        
+        Args:
+            serial (str): The serial number of the device.
+        
+        Returns:
+            AdbShell: The started shell.
+        """
+        process = await asyncio.create_subprocess_exec(
+            "adb", "-s", serial, "shell",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT
+        )
+        return cls(serial, process)
+
+    async def run(self, command: str) -> Optional[str]:
+        """
+        Runs a command in the shell and returns its output.
+        
+        Args:
+            command (str): The shell command to run on the device.
+        
+        Returns:
+            Optional[str]: The output of the command, or None if the command fails
+                           or the shell has exited.
+        """
+        command_line = (
+            f'echo {self._quote_marker(SHELL_BEGIN_MARKER)}; '
+            f'{command}; echo {self._quote_marker(SHELL_SENTINEL)}$?'
+        )
+        try:
+            self.stdin.write(f"{command_line}\n".encode('utf-8'))
+            await self.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError, OSError) as e:
+            print(f"Error executing command on {self.serial}: {e}")
+            return None
+
+        lines = []
+        started = False
+        while True:
+            raw_line = await self.stdout.readline()
+            if not raw_line:
+                break
+            # PTY shells (used by older adbd versions) end lines with \r\n
+            line = raw_line.decode('utf-8', errors='replace').rstrip('\r\n')
+            if not started:
+                started = _SHELL_BEGIN_RE.search(line) is not None
+                continue
+            match = _SHELL_END_RE.match(line)
+            if match:
+                lines.append(match.group(1))
+                if match.group(2) != "0":
+                    print(f"Error executing command on {self.serial}: '{command}' returned {match.group(2)}")
+                    return None
+                return "\n".join(lines).strip()
+            lines.append(line)
+
+        print(f"Error executing command on {self.serial}: shell exited")
+        return None
+
+    @staticmethod
+    def _quote_marker(marker: str) -> str:
+        """
+        Quotes a marker for `echo` as two adjacent strings, so the shell prints the
+        marker while its literal text never appears in the (possibly echoed) command line.
+        
+        Args:
+            marker (str): The marker to quote.
+        
+        Returns:
+            str: The quoted marker, e.g. "__E""ND__".
+        """
+        half = len(marker) // 2
+        return f'"{marker[:half]}""{marker[half:]}"'
+
+    async def close(self) -> None:
+        """
+        Ends the shell process.
+        """
+        if self.process.returncode is None:
+            try:
+                # Older adbd (shell protocol v1) keeps the session open on stdin EOF,
+                # so ask the shell to exit explicitly
+                self.stdin.write(b"exit\n")
+                await self.stdin.drain()
+                self.stdin.close()
+                await asyncio.wait_for(self.process.wait(), timeout=2)
+            except (ConnectionResetError, OSError, asyncio.TimeoutError):
+                self.process.kill()
+                await self.process.wait()
+
+# Shells are bound to the event loop that started them, so close_shells must
+# run before that loop finishes.
+_shells: Dict[str, AdbShell] = {}
+
+async def get_shell(serial: str) -> AdbShell:
+    """
+    Returns the cached AdbShell for a device, starting one if needed.
     
     Args:
         serial (str): The serial number of the device.
     
     Returns:
-        str: "usb" if the device is connected via USB, "wifi" if connected via Wi-Fi.
+        AdbShell: The shell for the device.
+    """
+    shell = _shells.get(serial)
+    if shell is None or shell.process.returncode is not None:
+        shell = _shells[serial] = await AdbShell.start(serial)
+    return shell
+
+async def close_shells() -> None:
+    """
+    Closes every cached AdbShell.
     """
-    devices_list = adb_command("adb devices -l")
+    shells = list(_shells.values())
+    _shells.clear()
+    await asyncio.gather(*(shell.close() for shell in shells))
+
+def _is_ip_serial(serial: str) -> bool:
+    """
+    Checks whether a serial belongs to a device connected over TCP/IP (e.g. 192.168.1.5:5555).
+    
+    Args:
+        serial (str): The serial number of the device.
+    
+    Returns:
+        bool: True if the serial is an IP address and port.
+    """
+    # Plain USB serials never contain a colon, so most lines skip the regex entirely
+    return ':' in serial and _IP_SERIAL_RE.match(serial) is not None
+
+@_ttl_cache(ttl=ADB_DEVICES_TTL)
+def get_adb_devices() -> Dict[str, Dict[str, str]]:
+    """
+    Parses a single `adb devices -l` call into the status and transport of every listed device.
+    Results are reused for ADB_DEVICES_TTL seconds, so callers that pass no parsed
+    map do not each run adb again.
+    
+    Returns:
+        Dict[str, Dict[str, str]]: A mapping of serial to a dictionary with 'status'
+                                   ('device', 'offline', etc.) and 'transport' ("usb" or "wifi"),
+                                   in the order adb lists the devices.
+    """
+    return _parse_adb_devices(adb_command(["adb", "devices", "-l"]))
+
+def _parse_adb_devices_line(line: str) -> Optional[Tuple[str, Dict[str, str]]]:
+    """
+    Parses a single line of `adb devices -l` output.
+    
+    Args:
+        line (str): The output line.
+    
+    Returns:
+        Optional[Tuple[str, Dict[str, str]]]: The serial and a dictionary with 'status' and
+                                              'transport', or None if the line lists no device.
+    """
+    fields = line.split()
+    if len(fields) < 2 or line.strip() == "List of devices attached":
+        return None
+    return fields[0], {
+        "status": fields[1],
+        "transport": "wifi" if ":5555" in line else "usb"
+    }
+
+def _parse_adb_devices(devices_list: Optional[str]) -> Dict[str, Dict[str, str]]:
+    """
+    Parses the output of `adb devices -l`.
+    
+    Args:
+        devices_list (Optional[str]): The raw command output.
     
+    Returns:
+        Dict[str, Dict[str, str]]: A mapping of serial to a dictionary with 'status' and 'transport'.
+    """
+    devices: Dict[str, Dict[str, str]] = {}
+
     if devices_list:
         for line in devices_list.splitlines():
-            if serial in line:
-                if ":5555" in line:
-                    return "wifi"
-                else:
-                    return "usb"
-    return "offline"
+            entry = _parse_adb_devices_line(line)
+            if entry:
+                devices[entry[0]] = entry[1]
+    return devices
 
-def get_device_ip(serial: str) -> Optional[str]:
+def get_device_connection_type(serial: str, devices: Optional[Dict[str, Dict[str, str]]] = None) -> str:
     """
-    Retrieves the IP address of the device.
+    Returns whether a device is connected via USB or Wi-Fi based on the adb devices -l output.
     
     Args:
         serial (str): The serial number of the device.
+        devices (Optional[Dict[str, Dict[str, str]]]): A result of get_adb_devices to reuse;
+                                                       adb is queried when omitted.
     
     Returns:
-        Optional[str]: The IP address of the device, or None if it cannot be determined.
+        str: "usb" if the device is connected via USB, "wifi" if connected via Wi-Fi.
     """
-    ip_address = adb_command(f"adb -s {serial} shell ip addr show wlan0 | grep inet")
-    if ip_address:
-        return ip_address.split()[1].split('/')[0]
-    return None
+    if devices is None:
+        devices = get_adb_devices()
 
-def get_device_info(serial: str) -> Optional[Dict[str, str]]:
+    if serial in devices:
+        return devices[serial]["transport"]
+    return "offline"
+
+def _parse_ip_address(output: Optional[str]) -> Optional[str]:
     """
-    Retrieves information for a given device using its serial number.
+    Extracts the IPv4 address from the output of `ip -o -4 addr show`.
     
     Args:
-        serial (str): The serial number of the device.
+        output (Optional[str]): The raw output of `ip -o -4 addr show wlan0`.
     
     Returns:
-        Optional[Dict[str, str]]: A dictionary containing 'model', 'device_type', 
-                                  'serial_number', and 'ip_address', or None if any 
-                                  information is unavailable.
+        Optional[str]: The IP address, or None if no IPv4 address is present.
+    """
+    match = _INET_RE.search(output) if output else None
+    return match.group(1) if match else None
+
+async def query_device(serial: str, include_ip: bool = False, include_properties: bool = True) -> Dict[str, Optional[str]]:
     """
-    model = adb_command(f"adb -s {serial} shell getprop ro.product.model")
-    device_type = adb_command(f"adb -s {serial} shell getprop ro.product.device")
-    serial_number = adb_command(f"adb -s {serial} shell getprop ro.serialno")
+    Reads the device properties and/or its Wi-Fi IP address with a single
+    command on the device's AdbShell instead of one round trip per value.
     
-    connection_type = get_device_connection_type(serial)
+    Args:
+        serial (str): The serial number of the device.
+        include_ip (bool): Whether to read the IP address of wlan0.
+        include_properties (bool): Whether to read the getprop properties.
     
-    ip_address = None
-    if connection_type == "wifi":
-        ip_address = get_device_ip(serial)
+    Returns:
+        Dict[str, Optional[str]]: 'model', 'device_type', 'serial_number' and 'ip_address';
+                                  values that were not requested or could not be read are None.
+    """
+    info: Dict[str, Optional[str]] = {field: None for field in (*DEVICE_PROPERTIES, "ip_address")}
+
+    queries: List[Tuple[str, str]] = []
+    if include_properties:
+        queries.extend((field, f"getprop {prop}") for field, prop in DEVICE_PROPERTIES.items())
+    if include_ip:
+        # `|| true` keeps a missing wlan0 from failing the whole invocation
+        queries.append(("ip_address", "ip -o -4 addr show wlan0 2>/dev/null || true"))
+    if not queries:
+        return info
+
+    payload = f"; echo {SECTION_DELIMITER}; ".join(command for _, command in queries)
+    output = await (await get_shell(serial)).run(payload)
+
+    sections: List[List[str]] = [[]]
+    if output:
+        for line in output.splitlines():
+            if line.strip() == SECTION_DELIMITER:
+                sections.append([])
+            else:
+                sections[-1].append(line)
+
+    for (field, _), section in zip(queries, sections):
+        value = "\n".join(section).strip()
+        info[field] = (_parse_ip_address(value) if field == "ip_address" else value) or None
+    return info
+
+async def get_device_info(serial: str, devices: Optional[Dict[str, Dict[str, str]]] = None,
+                          include_properties: bool = True,
+                          include_ip: Optional[bool] = None) -> Optional[Dict[str, Optional[str]]]:
+    """
+    Retrieves information for a given device using its serial number.
     
-    if connection_type == "usb":
-        ip_address = None
+    Args:
+        serial (str): The serial number of the device.
+        devices (Optional[Dict[str, Dict[str, str]]]): A result of get_adb_devices to reuse;
+                                                       adb is queried when omitted.
+        include_properties (bool): Whether to read 'model', 'device_type' and 'serial_number'.
+        include_ip (Optional[bool]): Whether to read 'ip_address'; by default it is only
+                                     read for devices connected over Wi-Fi.
+    
+    Returns:
+        Optional[Dict[str, Optional[str]]]: A dictionary containing 'model', 'device_type', 
+                                            'serial_number', and 'ip_address', or None if any 
+                                            requested property is unavailable.
+    """
+    if include_ip is None:
+        include_ip = get_device_connection_type(serial, devices) == "wifi"
+    info = await query_device(serial, include_ip=include_ip, include_properties=include_properties)
     
-    if model and device_type and serial_number:
-        return {
-            "model": model,
-            "device_type": device_type,
-            "serial_number": serial_number,
-            "ip_address": ip_address
-        }
-    return None
+    if include_properties and not (info["model"] and info["device_type"] and info["serial_number"]):
+        return None
+    return info
     
-def get_device_status(serial: str) -> str:
+def get_device_status(serial: str, devices: Optional[Dict[str, Dict[str, str]]] = None) -> str:
     """
     Retrieves the connection status of a device.
     
     Args:
         serial (str): The serial number of the device.
+        devices (Optional[Dict[str, Dict[str, str]]]): A result of get_adb_devices to reuse;
+                                                       adb is queried when omitted.
     
     Returns:
         str: The status of the device ('device', 'offline', etc.).
     """
-    devices_list = adb_command("adb devices")
-    if devices_list:
-        for line in devices_list.splitlines():
-            if serial in line:
-                status = line.split('\t')[1]
-                return status
+    if devices is None:
+        devices = get_adb_devices()
+
+    if serial in devices:
+        return devices[serial]["status"]
     return "offline"
 
-def update_device_map() -> None:
+async def _collect_device(serial: str, device: Optional[Dict[str, Any]], devices: Dict[str, Dict[str, str]],
+                          refresh: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Queries a single connected device. Devices are queried concurrently, so it only reads the
+    existing device entry and returns the changes instead of applying them.
+    
+    New devices are read in full. Properties already stored for a known device are
+    reused until they are older than STATIC_TTL; its IP address is re-read once it
+    is older than DYNAMIC_TTL.
+    
+    Args:
+        serial (str): The serial number of the device.
+        device (Optional[Dict[str, Any]]): The existing device_map entry, or None for a new device.
+        devices (Dict[str, Dict[str, str]]): The parsed `adb devices -l` output from get_adb_devices.
+        refresh (bool): Whether to re-read cached values regardless of their age.
+    
+    Returns:
+        Optional[Dict[str, Any]]: The fields to store for the device (the full entry for
+                                  a new device), or None if nothing could be read.
+    """
+    now = int(time.time())
+    cached: Dict[str, Any] = device or {}
+
+    updates: Dict[str, Any] = {}
+    connection_type = get_device_connection_type(serial, devices)
+    needs_properties = (
+        refresh
+        or not cached.get("model")
+        or not cached.get("device_type")
+        or now - cached.get("last_refreshed", 0) >= STATIC_TTL
+    )
+    needs_ip = connection_type == "wifi" and (
+        refresh
+        or not cached.get("ip_address")
+        or now - cached.get("ip_last_refreshed", 0) >= DYNAMIC_TTL
+    )
+
+    if needs_properties or needs_ip:
+        info = await get_device_info(serial, devices, include_properties=needs_properties, include_ip=needs_ip)
+        if info is None and device is None:
+            return None
+
+        if info is not None and needs_properties:
+            for field in ("model", "device_type"):
+                if info[field] or not cached.get(field):
+                    updates[field] = info[field] or ""
+            updates["last_refreshed"] = now
+
+        if info is not None and needs_ip:
+            if info["ip_address"]:
+                updates["ip_address"] = info["ip_address"]
+            updates["ip_last_refreshed"] = now
+
+    if connection_type == "usb" and not cached.get("ip_address"):
+        updates["ip_address"] = ""
+
+    if cached.get("status") != "device":
+        updates["status"] = "device"
+
+    if device is None:
+        return {"name": "", "serial": serial, "model": "", "device_type": "", "ip_address": "",
+                "status": "device", **updates}
+    return updates
+
+def update_device_map(refresh: bool = False) -> Dict[str, List[Dict[str, Any]]]:
     """
     Updates the device_map.json file by extracting data from all connected devices.
     Skips devices that are offline and updates data for those that are connected.
     The information is added or updated for existing devices.
+    
+    Args:
+        refresh (bool): Whether to re-read device information that is still cached.
+    
+    Returns:
+        Dict[str, List[Dict[str, Any]]]: The updated device map, as written to device_map.json.
+    """
+    return asyncio.run(update_device_map_async(refresh))
+
+async def update_device_map_async(refresh: bool = False) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Async implementation of update_device_map. Each device is queried as soon as
+    `adb devices -l` lists it, with at most MAX_CONCURRENT_QUERIES queries in
+    flight; results are merged once every query has finished.
+    
+    Args:
+        refresh (bool): Whether to re-read device information that is still cached.
+    
+    Returns:
+        Dict[str, List[Dict[str, Any]]]: The updated device map.
     """
-    devices_list = adb_command("adb devices")
     try:
-        with open("device_map.json", "r") as json_file:
-            device_map = json.load(json_file)
+        with open(DEVICE_MAP_FILE, "rb") as json_file:
+            original_data = json_file.read()
+        device_map = _load_json(original_data)
     except FileNotFoundError:
+        original_data = None
         device_map = {"devices": []}
 
-    device_index = {device["serial"]: idx for idx, device in enumerate(device_map["devices"])}
+    serial_to_device: Dict[str, Dict[str, Any]] = {device["serial"]: device for device in device_map["devices"]}
 
-    if devices_list:
-        for line in devices_list.splitlines():
-            if line.strip() and line.strip() != "List of devices attached":
-                serial = line.split('\t')[0]
-                if re.match(r'^\d{1,3}(\.\d{1,3}){3}:\d+$', serial):
-                    serial = ""
-                if not serial:
+    devices: Dict[str, Dict[str, str]] = {}
+    serials: List[str] = []
+    connected_serials: List[str] = []
+    tasks: List["asyncio.Task[Optional[Dict[str, Any]]]"] = []
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
+
+    async def collect(serial: str) -> Optional[Dict[str, Any]]:
+        async with semaphore:
+            return await _collect_device(serial, serial_to_device.get(serial), devices, refresh)
+
+    try:
+        # Start querying each device as soon as `adb devices -l` lists it
+        adb_lines = adb_command_lines_async(["adb", "devices", "-l"])
+        try:
+            async for line in adb_lines:
+                entry = _parse_adb_devices_line(line)
+                if entry is None:
                     continue
-                
-                status = get_device_status(serial)
-
-                if status == "device":
-                    if serial in device_index:
-                        device = device_map["devices"][device_index[serial]]
-                        updated = False
-
-                        if not device.get("model"):
-                            device["model"] = adb_command(f"adb -s {serial} shell getprop ro.product.model") or ""
-                            updated = True
-                        
-                        if not device.get("device_type"):
-                            device["device_type"] = adb_command(f"adb -s {serial} shell getprop ro.product.device") or ""
-                            updated = True
-
-                        connection_type = get_device_connection_type(serial)
-                        
-                        if connection_type == "wifi" and not device.get("ip_address"):
-                            ip_address = adb_command(f"adb -s {serial} shell ip addr show wlan0 | grep inet") or ""
-                            if ip_address:
-                                device["ip_address"] = ip_address.split()[1].split('/')[0]
-                            updated = True
-                        
-                        if connection_type == "usb" and not device.get("ip_address"):
-                            device["ip_address"] = ""
-                            updated = True
-
-                        if device.get("status") != status:
-                            device["status"] = status
-                            updated = True
-
-                        if updated:
-                            device_map["devices"][device_index[serial]] = device
-                    else:
-                        device_info = get_device_info(serial)
-                        if device_info:
-                            new_device = {
-                                "name": "",
-                                "serial": serial,
-                                "model": device_info.get("model", ""),
-                                "device_type": device_info.get("device_type", ""),
-                                "ip_address": device_info.get("ip_address", ""),
-                                "status": status
-                            }
-                            device_map["devices"].append(new_device)
-                            device_index[serial] = len(device_map["devices"]) - 1
-
-                else:
-                    existing_device = next((device for device in device_map['devices'] if device['serial'] == serial), None)
-                    display_name = existing_device.get("name") or existing_device.get("model") or serial if existing_device else serial
-                    print(f"Device '{display_name}' is offline. Skipping...")
-
-    with open("device_map.json", "w") as json_file:
-        json.dump(device_map, json_file, indent=4)
-
-    # print("device_map.json has been updated.")
-
-def is_device_authorized(serial: str) -> bool:
+                serial, devices[serial] = entry
+                if _is_ip_serial(serial):
+                    continue
+                serials.append(serial)
+
+                # Offline and unauthorized devices cannot answer shell commands, so skip them
+                if devices[serial]["status"] == "device":
+                    connected_serials.append(serial)
+                    tasks.append(asyncio.create_task(collect(serial)))
+            listed = True
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"Error executing command: {e}")
+            listed = False
+        finally:
+            await adb_lines.aclose()
+
+        if listed:
+            # Let get_adb_devices reuse this listing instead of running adb again
+            get_adb_devices.cache_set(devices)
+            results = dict(zip(connected_serials, await asyncio.gather(*tasks)))
+        else:
+            # Lines streamed before adb failed cannot be trusted; the pending
+            # queries are cancelled below and no device is listed
+            serials.clear()
+            results = {}
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await close_shells()
+
+    # Merge in `adb devices` order so new devices are appended deterministically
+    for serial in serials:
+        if serial in results:
+            fields = results[serial]
+            if serial in serial_to_device:
+                if fields:
+                    serial_to_device[serial].update(fields)
+            elif fields:
+                serial_to_device[serial] = fields
+                device_map["devices"].append(fields)
+
+        else:
+            existing_device = serial_to_device.get(serial)
+            if existing_device:
+                # Record the listed status so the menu does not offer this device
+                existing_device["status"] = devices[serial]["status"]
+            display_name = existing_device.get("name") or existing_device.get("model") or serial if existing_device else serial
+            print(f"Device '{display_name}' is offline. Skipping...")
+
+    # Known devices that adb no longer lists at all are disconnected
+    if listed:
+        for serial, device in serial_to_device.items():
+            if serial not in devices and device.get("status") == "device":
+                device["status"] = "offline"
+
+    # Skip the write when nothing changed; otherwise replace the file atomically
+    # so an interrupted run cannot leave a truncated map behind.
+    new_data = _dump_json(device_map)
+    if new_data != original_data:
+        temp_file = f"{DEVICE_MAP_FILE}.tmp"
+        with open(temp_file, "wb") as temp_json_file:
+            temp_json_file.write(new_data)
+        os.replace(temp_file, DEVICE_MAP_FILE)
+
+        # print("device_map.json has been updated.")
+
+    return device_map
+
+def is_device_authorized(serial: str, devices: Optional[Dict[str, Dict[str, str]]] = None) -> bool:
     """
     Checks if the device is authorized for ADB connections.
     
     Args:
         serial (str): The serial number of the device.
+        devices (Optional[Dict[str, Dict[str, str]]]): A result of get_adb_devices to reuse;
+                                                       the cached get_adb_devices result is used
+                                                       when omitted.
     
     Returns:
         bool: True if the device is authorized, False if unauthorized.
     """
-    # Check the device status using `adb devices`
-    devices_list = adb_command("adb devices")
-    
-    # Check if the command returned any data
-    if devices_list:
-        for line in devices_list.splitlines():
-            if serial in line:
-                status = line.split('\t')[1]
-                if status == "device":
-                    return True  # Authorized device
-                elif status == "unauthorized":
-                    return False  # Unauthorized device
-    return False  # Device not found or any other status
+    # Authorized devices are listed as "device"; "unauthorized", "offline" or a
+    # missing entry all mean the device cannot be used
+    return get_device_status(serial, devices) == "device"
 
-def display_device_menu(devices: List[Dict[str, str]]) -> int:
+def display_device_menu(devices: List[Dict[str, Any]],
+                        adb_devices: Optional[Dict[str, Dict[str, str]]] = None) -> int:
     """
     Displays a CLI menu with all connected devices and returns the selected device index.
     
     Args:
-        devices (List[Dict[str, str]]): A list of devices to display in the menu.
+        devices (List[Dict[str, Any]]): A list of devices to display in the menu.
+        adb_devices (Optional[Dict[str, Dict[str, str]]]): A result of get_adb_devices to check
+                                                           authorization against; adb is queried
+                                                           when omitted.
     
     Returns:
         int: The selected device index, or 0 if the user wants to exit.
@@ -245,44 +769,46 @@ def display_device_menu(devices: List[Dict[str, str]]) -> int:
         device_name = device.get("name") or device.get("model") or device["serial"]
         print(f"{index}. {device_name} ({device['serial']})")
     
-    # Get user input
-    try:
-        choice = int(input("\nSelect a number: "))
-        if 0 <= choice <= len(devices):
-            # Get the selected device's serial
-            selected_device = devices[choice - 1]
-            serial = selected_device['serial']
-            
-            # Check if the device is authorized
-            if not is_device_authorized(serial):
-                print(f"\nDevice {device_name} is unauthorized for ADB connection.")
-                print("Please authorize the device via USB first and try again.")
-                # Exit or ask the user to reconnect via USB
-                return 0
-            
-            # Proceed with the selection
-            return choice
-            
-        else:
+    # Get user input, re-prompting (without redrawing the menu) until it is valid
+    while True:
+        try:
+            choice = int(input("\nSelect a number: "))
+        except ValueError:
+            print("Invalid input. Please enter a number.")
+            continue
+
+        if not 0 <= choice <= len(devices):
             print("Invalid choice. Please enter a valid number.")
-            # Recurse until valid input
-            return display_device_menu(devices)
-    except ValueError:
-        print("Invalid input. Please enter a number.")
-        # Recurse until valid input
-        return display_device_menu(devices)
+            continue
+
+        if choice == 0:
+            return 0
+
+        # Get the selected device's serial
+        selected_device = devices[choice - 1]
+        serial = selected_device['serial']
+        
+        # Check if the device is authorized
+        if not is_device_authorized(serial, adb_devices):
+            device_name = selected_device.get("name") or selected_device.get("model") or serial
+            print(f"\nDevice {device_name} is unauthorized for ADB connection.")
+            print("Please authorize the device via USB first and try again.")
+            # Exit or ask the user to reconnect via USB
+            return 0
+        
+        # Proceed with the selection
+        return choice
+
 def main() -> None:
     """
     Main function to update the device map, display the menu, and connect to the selected device.
     """
-    update_device_map()
+    parser = argparse.ArgumentParser(description="Map ADB devices and connect to one with scrcpy.")
+    parser.add_argument("--refresh", action="store_true",
+                        help="re-read device information even if it is cached in device_map.json")
+    args = parser.parse_args()
 
-    try:
-        with open("device_map.json", "r") as json_file:
-            device_map = json.load(json_file)
-    except FileNotFoundError:
-        print("No devices found.")
-        return
+    device_map = update_device_map(refresh=args.refresh)
 
     devices = [device for device in device_map["devices"] if device["status"] == "device"]
 
@@ -290,48 +816,53 @@ def main() -> None:
         print("No devices are currently connected. Exiting.")
         return
 
-    while True:
-        choice = display_device_menu(devices)
+    # The listing update_device_map just parsed is still cached, so this runs no adb
+    # command; device statuses in the map were taken from the same listing.
+    adb_devices = get_adb_devices()
 
-        if choice == 0:
-            print("Exiting...")
-            break
+    choice = display_device_menu(devices, adb_devices)
 
-        # Get the selected device from the list (adjust index as Python is 0-based)
-        selected_device = devices[choice - 1]
-
-        # Disconnect all devices except the selected one
-        for device in devices:
-            if device != selected_device:
-                serial = device["serial"]
-                print(f"Disconnecting {device['name']} ({serial})...")
-                adb_command(f"adb -s {serial} disconnect")
-
-        # Connect to the selected device
-        serial = selected_device["serial"]
-        connection_type = get_device_connection_type(serial)
+    if choice == 0:
+        print("Exiting...")
+        return
 
-        if connection_type == "wifi":
-            # print(f"Connecting to {selected_device['name']} over Wi-Fi...")
-            adb_command(f"adb connect {selected_device['ip_address']}:5555")
-        elif connection_type == "usb":
-            # print(f"Connecting to {selected_device['name']} via USB...")
-            adb_command(f"adb -s {serial} usb")
+    # Get the selected device from the list (adjust index as Python is 0-based)
+    selected_device = devices[choice - 1]
+
+    # Disconnect all devices except the selected one. USB devices need no explicit
+    # disconnect, and a single `adb disconnect` drops every Wi-Fi connection at once;
+    # the selected device is reconnected below.
+    wifi_devices = [
+        device for device in devices
+        if device != selected_device and get_device_connection_type(device["serial"], adb_devices) == "wifi"
+    ]
+    if wifi_devices:
+        for device in wifi_devices:
+            print(f"Disconnecting {device['name']} ({device['serial']})...")
+        adb_command(["adb", "disconnect"])
+
+    # Connect to the selected device
+    serial = selected_device["serial"]
+    connection_type = get_device_connection_type(serial, adb_devices)
 
-        # Launch scrcpy to allow remote access to the device
-        # print(f"Launching scrcpy for {selected_device['name']}...")
+    if connection_type == "wifi":
+        # print(f"Connecting to {selected_device['name']} over Wi-Fi...")
+        adb_command(["adb", "connect", f"{selected_device['ip_address']}:5555"])
+    elif connection_type == "usb":
+        # print(f"Connecting to {selected_device['name']} via USB...")
+        adb_command(["adb", "-s", serial, "usb"])
 
-        # Suppress output by redirecting both stdout and stderr to os.devnull
-        subprocess.run(["scrcpy", "-s", serial], stdout=open(os.devnull, 'w'), stderr=open(os.devnull, 'w'))
+    # Launch scrcpy to allow remote access to the device
+    # print(f"Launching scrcpy for {selected_device['name']}...")
 
-        # Wait for user to manually stop scrcpy
-        # print(f"Press Ctrl+C to exit scrcpy for {selected_device['name']}...")
+    # Suppress output by discarding both stdout and stderr
+    subprocess.run(["scrcpy", "-s", serial], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
-        # After scrcpy is closed, exit the program instead of going back to the menu
-        print("\nDisconnected.")
+    # Wait for user to manually stop scrcpy
+    # print(f"Press Ctrl+C to exit scrcpy for {selected_device['name']}...")
 
-        # Exit the script immediately
-        sys.exit()
+    # After scrcpy is closed, exit the program instead of going back to the menu
+    print("\nDisconnected.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file